@@ -1,5 +1,8 @@
 import os
-from PyQt5.QtCore import Qt, QDateTime
+import sys
+import threading
+from PyQt5.QtCore import Qt, QDateTime, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import (
     QDialog,
     QVBoxLayout,
@@ -15,10 +18,27 @@ from PyQt5.QtWidgets import (
     QDoubleSpinBox,
     QComboBox,
     QWidget,
+    QPlainTextEdit,
 )
 from qgis.utils import iface
 from fire_areas import process_fire_grid
 
+# --- Parámetros avanzados: (clave, etiqueta, descripción, widget, opciones) ---
+DETECTION_PARAMS = [
+    ("method", "Method", "Detection type: RGB, HSV, or both (default=hsv)",
+     QComboBox, {"items": ["hsv", "rgb", "combined"]}),
+    ("upscale_factor", "Upscale factor", "Controls subpixel simulation (default=4)",
+     QSpinBox, {"range": (1, 10), "value": 4}),
+    ("blur_sigma", "Blur sigma", "Controls edge smoothing (default=3.0)",
+     QDoubleSpinBox, {"range": (0.1, 10.0), "step": 0.1, "value": 3.0}),
+    ("threshold_value", "Threshold value", "Sets fire detection sensitivity (default=0.8)",
+     QDoubleSpinBox, {"range": (0.0, 1.0), "step": 0.05, "value": 0.8}),
+    ("tol", "RGB tolerance", "Tolerance for RGB matching (default=40)",
+     QSpinBox, {"range": (0, 255), "value": 40}),
+    ("min_area_ha", "Min area (ha)", "Minimum polygon area retained (default=1 ha)",
+     QDoubleSpinBox, {"range": (0.1, 100.0), "step": 0.1, "value": 1.0}),
+]
+
 def get_current_bbox():
     """Get bbox of current QGIS canvas, rounded to 4 decimals."""
     extent = iface.mapCanvas().extent()
@@ -29,6 +49,59 @@ def get_current_bbox():
         round(extent.yMaximum(), 4),
     )
 
+# --- Redirección de stdout hacia el terminal del widget ---
+class StdoutRedirector(QObject):
+    """File-like stdout replacement that emits buffered text through a Qt signal.
+
+    Worker threads may print while processing, so text is never written to a widget
+    directly: it is batched and delivered to the GUI thread with a queued signal.
+    """
+    line_written = pyqtSignal(str)
+
+    def __init__(self, max_buffer=4096, parent=None):
+        super().__init__(parent)
+        self._buf = []
+        self._size = 0
+        self._max_buffer = max_buffer
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        if not text:
+            return
+        with self._lock:
+            self._buf.append(text)
+            self._size += len(text)
+            ready = "\n" in text or self._size >= self._max_buffer
+        if ready:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            text = "".join(self._buf)
+            self._buf = []
+            self._size = 0
+        if text:
+            self.line_written.emit(text)
+
+# --- Hilo de procesamiento: la GUI sigue atendiendo eventos (y el terminal) durante la ejecución ---
+class ProcessingThread(QThread):
+    """Run `process_fire_grid` off the GUI thread; `done` carries the error text ('' on success)."""
+    done = pyqtSignal(str)
+
+    def __init__(self, args, kwargs, parent=None):
+        super().__init__(parent)
+        self._args = args
+        self._kwargs = kwargs
+
+    def run(self):
+        try:
+            process_fire_grid(*self._args, **self._kwargs)
+        except Exception as error:
+            print(f"❌ Processing failed: {error}")
+            self.done.emit(str(error) or type(error).__name__)
+        else:
+            self.done.emit("")
+
 # --- Clase para el panel desplegable ---
 class CollapsiblePanel(QWidget):
     def __init__(self, title, parent=None):
@@ -78,7 +151,12 @@ class FireMonitorWidget(QDialog):
         self.layout.addWidget(self.label_bbox)
         self.layout.addWidget(self.coords_label)
         # LÍNEA CORREGIDA: Habilitar la conexión con el lienzo del mapa para que el BBox se actualice
-        iface.mapCanvas().extentsChanged.connect(self.update_bbox_labels)
+        # Los cambios de extensión se agrupan con un temporizador (máx. 20 actualizaciones/s)
+        self._bbox_timer = QTimer(self)
+        self._bbox_timer.setSingleShot(True)
+        self._bbox_timer.setInterval(50)
+        self._bbox_timer.timeout.connect(self.update_bbox_labels)
+        iface.mapCanvas().extentsChanged.connect(self._bbox_timer.start)
 
         # --- Selectores de fecha/hora ---
         self.start_dt = QDateTimeEdit()
@@ -132,37 +210,19 @@ class FireMonitorWidget(QDialog):
             row.addWidget(widget)
             parent_layout.addLayout(row)
 
-        self.method_box = QComboBox()
-        self.method_box.addItems(["hsv", "rgb", "combined"])
-        add_param_row(advanced_layout, "Method", "Detection type: RGB, HSV, or both (default=hsv)", self.method_box)
-
-        self.upscale_spin = QSpinBox()
-        self.upscale_spin.setRange(1, 10)
-        self.upscale_spin.setValue(4)
-        add_param_row(advanced_layout, "Upscale factor", "Controls subpixel simulation (default=4)", self.upscale_spin)
-
-        self.blur_spin = QDoubleSpinBox()
-        self.blur_spin.setRange(0.1, 10.0)
-        self.blur_spin.setSingleStep(0.1)
-        self.blur_spin.setValue(3.0)
-        add_param_row(advanced_layout, "Blur sigma", "Controls edge smoothing (default=3.0)", self.blur_spin)
-
-        self.thresh_spin = QDoubleSpinBox()
-        self.thresh_spin.setRange(0.0, 1.0)
-        self.thresh_spin.setSingleStep(0.05)
-        self.thresh_spin.setValue(0.8)
-        add_param_row(advanced_layout, "Threshold value", "Sets fire detection sensitivity (default=0.8)", self.thresh_spin)
-
-        self.tol_spin = QSpinBox()
-        self.tol_spin.setRange(0, 255)
-        self.tol_spin.setValue(40)
-        add_param_row(advanced_layout, "RGB tolerance", "Tolerance for RGB matching (default=40)", self.tol_spin)
-
-        self.min_area_spin = QDoubleSpinBox()
-        self.min_area_spin.setRange(0.1, 100.0)
-        self.min_area_spin.setSingleStep(0.1)
-        self.min_area_spin.setValue(1.0)
-        add_param_row(advanced_layout, "Min area (ha)", "Minimum polygon area retained (default=1 ha)", self.min_area_spin)
+        self.param_widgets = {}
+        for name, bold_text, description, widget_cls, options in DETECTION_PARAMS:
+            widget = widget_cls()
+            if "items" in options:
+                widget.addItems(options["items"])
+            if "range" in options:
+                widget.setRange(*options["range"])
+            if "step" in options:
+                widget.setSingleStep(options["step"])
+            if "value" in options:
+                widget.setValue(options["value"])
+            add_param_row(advanced_layout, bold_text, description, widget)
+            self.param_widgets[name] = widget
 
         self.collapsible_widget = CollapsiblePanel("▼ Advance —")
         self.collapsible_widget.setContentLayout(advanced_layout)
@@ -182,6 +242,18 @@ class FireMonitorWidget(QDialog):
         btn_layout.addWidget(self.run_button)
         self.layout.addLayout(btn_layout)
 
+        # --- Terminal de salida ---
+        self.terminal_panel = QPlainTextEdit()
+        self.terminal_panel.setReadOnly(True)
+        self.terminal_panel.setMaximumBlockCount(2000)
+        self.layout.addWidget(self.terminal_panel)
+
+        self.stdout_redirector = StdoutRedirector(parent=self)
+        self.stdout_redirector.line_written.connect(self.append_terminal_text, Qt.QueuedConnection)
+        self._processing_thread = None
+        self._original_stdout = None
+        self._output_path = None
+
         # Espaciador para empujar los botones hacia abajo
         self.layout.addStretch()
 
@@ -190,6 +262,8 @@ class FireMonitorWidget(QDialog):
 
     # --- Métodos de la clase principal ---
     def run_script(self):
+        if self._processing_thread is not None and self._processing_thread.isRunning():
+            return
         if not self.file_input.text().strip():
             QMessageBox.warning(self, "Error", "Please select an output file.")
             return
@@ -200,17 +274,34 @@ class FireMonitorWidget(QDialog):
         shapefile_path = self.file_input.text().strip()
 
         detection_params = {
-            "method": self.method_box.currentText(),
-            "upscale_factor": self.upscale_spin.value(),
-            "blur_sigma": self.blur_spin.value(),
-            "threshold_value": self.thresh_spin.value(),
-            "tol": self.tol_spin.value(),
-            "min_area_ha": self.min_area_spin.value()
+            name: widget.currentText() if isinstance(widget, QComboBox) else widget.value()
+            for name, widget in self.param_widgets.items()
         }
 
+        # stdout stays redirected until the thread finishes; the queued signal reaches the
+        # terminal while the GUI event loop keeps running
+        self._original_stdout = sys.stdout
+        sys.stdout = self.stdout_redirector
         print(f"🚀 Running fire detection for {bbox} from {start} to {end}")
-        process_fire_grid(bbox, start, end, shapefile_path, detection_params=detection_params)
-        
+
+        self._output_path = shapefile_path
+        self.run_button.setEnabled(False)
+        self._processing_thread = ProcessingThread(
+            (bbox, start, end, shapefile_path), {"detection_params": detection_params}, parent=self
+        )
+        self._processing_thread.done.connect(self.on_run_finished)
+        self._processing_thread.start()
+
+    def on_run_finished(self, error):
+        self.stdout_redirector.flush()
+        sys.stdout = self._original_stdout
+        self.run_button.setEnabled(True)
+
+        if error:
+            QMessageBox.critical(self, "Error", f"Processing failed:\n{error}")
+            return
+
+        shapefile_path = self._output_path
         layer_name = os.path.splitext(os.path.basename(shapefile_path))[0]
         
         if os.path.exists(shapefile_path):
@@ -219,6 +310,13 @@ class FireMonitorWidget(QDialog):
         else:
             QMessageBox.warning(self, "Warning", "No wildfires were detected in the area for the date range.")
 
+    def append_terminal_text(self, text):
+        self.terminal_panel.setUpdatesEnabled(False)
+        self.terminal_panel.moveCursor(QTextCursor.End)
+        self.terminal_panel.insertPlainText(text)
+        self.terminal_panel.setUpdatesEnabled(True)
+        self.terminal_panel.ensureCursorVisible()
+
     def update_bbox_labels(self):
         lon_min, lat_min, lon_max, lat_max = get_current_bbox()
         self.coords_label.setText(
@@ -238,12 +336,13 @@ class FireMonitorWidget(QDialog):
             self.end_dt.setDateTime(start)
 
     def select_output_file(self):
-        path, _ = QFileDialog.getSaveFileName(
-            self, "Select Output File", "", "Shapefiles (*.shp)"
+        path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Select Output File", "", "Shapefiles (*.shp);;GeoPackage (*.gpkg);;FlatGeobuf (*.fgb)"
         )
         if path:
-            if not path.lower().endswith(".shp"):
-                path += ".shp"
+            if not path.lower().endswith((".shp", ".gpkg", ".fgb")):
+                extensions = {"gpkg": ".gpkg", "fgb": ".fgb"}
+                path += next((ext for key, ext in extensions.items() if key in selected_filter), ".shp")
             self.file_input.setText(path)
 
     def show_about(self):
@@ -1,4 +1,4 @@
-import importlib
+import importlib.util
 import subprocess
 import sys
 
@@ -33,22 +33,31 @@ REQUIREMENTS = {
     "urllib3": "urllib3==2.5.0",
 }
 
-def install_package(pkg_spec):
-    """Install a package via pip"""
+def install_packages(pkg_specs):
+    """Install several packages with a single pip invocation"""
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", pkg_spec])
+        subprocess.check_call([
+            sys.executable, "-m", "pip", "install",
+            "--disable-pip-version-check", "--no-input", "--prefer-binary",
+            *pkg_specs
+        ])
     except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to install {pkg_spec}: {e}")
+        print(f"❌ Failed to install {', '.join(pkg_specs)}: {e}")
 
 def check_and_install():
-    """Check each requirement and install if missing"""
+    """Check each requirement and install the missing ones at once"""
+    missing = []
     for module_name, pkg_spec in REQUIREMENTS.items():
-        try:
-            importlib.import_module(module_name)
+        # find_spec only locates the module, it does not run it (no heavy C-extension init)
+        if importlib.util.find_spec(module_name) is not None:
             print(f"✅ {pkg_spec} already installed")
-        except ImportError:
-            print(f"📦 Installing missing package: {pkg_spec}")
-            install_package(pkg_spec)
+        else:
+            print(f"📦 Missing package: {pkg_spec}")
+            missing.append(pkg_spec)
+
+    if missing:
+        print(f"📦 Installing {len(missing)} missing packages...")
+        install_packages(missing)
 
 if __name__ == "__main__":
     print("🔍 Checking and installing required dependencies...")
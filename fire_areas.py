@@ -1,7 +1,11 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-import numpy as np
+import geopandas as gpd
+import hashlib
+import multiprocessing
 import os
 from owslib.wms import WebMapService
+import threading
 
 # Nota: Asegúrate de que fire_utils.py contiene las funciones correctas
 # que se han mantenido sin cambios en este flujo de trabajo.
@@ -9,16 +13,124 @@ from fire_utils import (
     generate_datetimes,
     compute_grid_for_bbox,
     split_bbox,
+    split_image,
     calculate_image_size,
     get_wms_image,
     load_image,
+    is_uniform_image,
     detect_areas,
     calculate_polygon_areas,
     create_geodataframe,
-    create_shapefile,
-    update_shapefile
+    init_fire_history,
+    update_fire_history,
+    read_fires,
+    write_fires
 )
 
+# 🌐 Source WMS (not edit)
+WMS_URL = 'https://view.eumetsat.int/geoserver/wms'
+TARGET_LAYER = 'mtg_fd:rgb_firetemperature'
+
+# 🗄️ WMS connections already opened in this process, keyed by (url, version)
+_wms_cache: dict[tuple[str, str], WebMapService] = {}
+_wms_lock = threading.Lock()
+
+def _get_wms(url: str = WMS_URL, version: str = "1.3.0") -> WebMapService:
+    """
+    Return a cached WebMapService for `url`, connecting (GetCapabilities) only on first use.
+
+    The handle is shared by every thread of `process_fire_grid` and `fire_areas`.
+    GetMap requests still go through owslib's `openURL`, which opens one HTTP
+    connection per call; requests are overlapped with threads instead.
+    """
+    key = (url, version)
+    wms = _wms_cache.get(key)
+    if wms is None:
+        with _wms_lock:
+            wms = _wms_cache.get(key)
+            if wms is None:
+                print("🔌 Connecting to WMS...")
+                wms = WebMapService(url, version=version)
+                _wms_cache[key] = wms
+    return wms
+
+def _supertiles(sub_boxes, n_rows: int, n_cols: int, pixel_size_m: float, max_request_px: int):
+    """
+    Group the sub-bbox grid into blocks that can be requested with a single GetMap.
+
+    Yields (bbox, size, rows, cols): the block bbox, its image size in pixels and
+    the ranges of grid rows/columns it covers. Each side stays <= max_request_px.
+    Tiles get the size a request of their sub-bbox alone would use (`calculate_image_size`,
+    square pixels of about `pixel_size_m`), taken from the middle row of the block.
+    """
+    # Sub-bboxes span fewer meters of longitude towards the poles: one tile size per grid row
+    row_tiles = [calculate_image_size(sub_boxes[r * n_cols], pixel_size_m) for r in range(n_rows)]
+    cols_per_block = max(1, max_request_px // max(w for w, _ in row_tiles))
+    rows_per_block = max(1, max_request_px // max(h for _, h in row_tiles))
+    for r0 in range(0, n_rows, rows_per_block):
+        rows = range(r0, min(r0 + rows_per_block, n_rows))
+        tile_w, tile_h = row_tiles[rows[len(rows) // 2]]
+        for c0 in range(0, n_cols, cols_per_block):
+            cols = range(c0, min(c0 + cols_per_block, n_cols))
+            lower_left = sub_boxes[rows[0] * n_cols + cols[0]]
+            upper_right = sub_boxes[rows[-1] * n_cols + cols[-1]]
+            bbox = (float(lower_left[0]), float(lower_left[1]), float(upper_right[2]), float(upper_right[3]))
+            size = (len(cols) * tile_w, len(rows) * tile_h)
+            yield bbox, size, rows, cols
+
+def _fetch_image(wms: WebMapService, bbox: tuple, date_str: str, size: tuple, cache_dir: str = None):
+    """Download and decode one WMS image: returns (rgb, transform, crs)."""
+    img_bytes = get_wms_image(wms, TARGET_LAYER, bbox, date_str, size, cache_dir=cache_dir)
+    return load_image(img_bytes, bbox=bbox, size=size)
+
+def _download_image(wms: WebMapService, bbox: tuple, date_str: str, size: tuple, cache_dir: str = None):
+    """Download one WMS image: returns (digest, img_bytes) with a content hash of the bytes."""
+    img_bytes = get_wms_image(wms, TARGET_LAYER, bbox, date_str, size, cache_dir=cache_dir)
+    return hashlib.blake2b(img_bytes, digest_size=16).digest(), img_bytes
+
+def _detect_block(img_bytes: bytes, bbox: tuple, size: tuple, n_rows: int, n_cols: int,
+                  date_str: str, detection_params: dict = None):
+    """
+    Decode one block and detect fires on each of its tiles (worker process task).
+
+    Only the response bytes go in and only polygons come out: no image array is pickled.
+    Returns 'false_image' if the whole block is blank, otherwise the list of tile results
+    of `detect_fire_polygons` in tile order (the exception instead, if one raised).
+    Decoding errors are raised.
+    """
+    rgb, transform, crs = load_image(img_bytes, bbox=bbox, size=size)
+    if is_uniform_image(rgb):
+        return 'false_image'
+
+    tile_results = []
+    tile_w, tile_h = rgb.shape[1] // n_cols, rgb.shape[0] // n_rows
+    for tile, tile_transform in split_image(rgb, transform, n_rows, n_cols, tile_w, tile_h):
+        try:
+            tile_results.append(detect_fire_polygons(tile, tile_transform, crs, date_str,
+                                                     detection_params=detection_params))
+        except Exception as e:
+            tile_results.append(e)
+    return tile_results
+
+def _write_fires(fires_gdf: gpd.GeoDataFrame, shapefile_path: str, written: tuple = None) -> tuple:
+    """
+    Write the in-memory fire history to `shapefile_path` (driver from the extension: .shp, .gpkg or .fgb).
+
+    The history only grows by appending rows: when the file already holds its first
+    `written[0]` rows with the same columns `written[1]`, only the new rows are appended.
+    Returns the `written` state of the file after this call.
+    """
+    columns = tuple(fires_gdf.columns)
+    if written is not None and written[1] == columns and 0 < written[0] <= len(fires_gdf):
+        new_rows = fires_gdf.iloc[written[0]:]
+        if len(new_rows):
+            write_fires(new_rows, shapefile_path, mode="a")
+            print(f"💾 Shapefile appended: {shapefile_path} (+{len(new_rows)} → {len(fires_gdf)} records)")
+    else:
+        write_fires(fires_gdf, shapefile_path)
+        print(f"💾 Shapefile saved: {shapefile_path} ({len(fires_gdf)} records)")
+    return len(fires_gdf), columns
+
 def process_fire_grid(
     bbox: tuple,
     start: str,
@@ -27,7 +139,12 @@ def process_fire_grid(
     step_minutes: int = 10,
     pixel_size_m: float = 500.0,
     base_px: int = 500,
-    detection_params: dict = None
+    detection_params: dict = None,
+    max_workers: int = 8,
+    max_request_px: int = 4096,
+    flush_every: int = 100,
+    use_processes: bool = False,
+    cache_dir: str = None
 ):
     """
     Iterate over a large bounding box divided into sub-bboxes and send fire detections to shapefile.
@@ -49,25 +166,64 @@ def process_fire_grid(
     base_px : int, optional
         Base pixel width/height of each subimage (default=500).
     detection_params : dict, optional
-        Extra parameters for fire detection, forwarded to `fire_areas`.
+        Extra parameters for fire detection, forwarded to `detect_fire_polygons`.
         Accepted keys:
             - method : str, detection method ('rgb', 'hsv' [default], or 'combined').
             - upscale_factor : int, scaling factor for subpixel simulation (default=1).
             - blur_sigma : float, sigma for Gaussian blur (default=3.0).
             - threshold_value : float, threshold (0–1) after blur (default=0.8).
             - tol : int, tolerance for RGB detection (default=40).
+            - engine : str, mask kernel ('auto' [default], 'numba', 'opencv' or 'opencl').
+            - min_area_ha : float, minimum polygon area retained in hectares (default=1.0).
+            - chain_approx : str, contour approximation ('simple' [default] or 'tc89_kcos').
+            - approx_epsilon : float, Douglas-Peucker tolerance of the contours in upscaled
+              pixels (default=0.5, 0 keeps every contour vertex).
         Example:
             detection_params = {
                 "method": "combined",
                 "upscale_factor": 2,
                 "blur_sigma": 2.5
             }
+    max_workers : int, optional
+        Number of WMS requests run concurrently (default=8). Decoding and sub-bbox
+        detections, which are CPU-bound, use at most one thread per CPU core.
+    max_request_px : int, optional
+        Maximum width/height in pixels of a single GetMap request (default=4096).
+    flush_every : int, optional
+        Write the shapefile every `flush_every` timestamps, besides the final write (default=100).
+    use_processes : bool, optional
+        Run decoding and detection in a pool of worker processes instead of threads
+        (default=False). Each block is one task: the worker receives the response bytes,
+        decodes, splits and detects, and returns only the polygons. Workers are spawned,
+        so only use it from standalone scripts (under an `if __name__ == "__main__":`
+        guard), not from inside QGIS. Worker output is printed by the worker processes.
+    cache_dir : str, optional
+        Directory of an on-disk cache of GetMap responses (default=None, disabled), e.g.
+        "~/.cache/fire_areas". Reruns over the same grid and time range read the images
+        from disk instead of downloading them again. Only cache past time ranges: frames
+        requested before they are published are stored as the server returned them.
 
     Notes
     -----
     - The bbox is split into sub-bboxes such that each subimage covers roughly
       (base_px * pixel_size_m) meters.
+    - For each timestamp the whole grid is downloaded with as few GetMap requests as
+      possible (blocks of at most `max_request_px` per side) and sliced client-side
+      into one tile per sub-bbox, sized as `calculate_image_size` would size that
+      sub-bbox alone (square pixels of about `pixel_size_m`).
     - The function prints progress for each (time, sub-bbox) combination.
+    - Requests and detections run in thread pools sharing a single WMS connection;
+      results are merged in sub-bbox order. Downloads of the next timestamps are
+      prefetched while the current one is being detected.
+    - A block whose bytes are identical to the previous timestamp (same satellite scan)
+      is not decoded nor detected again.
+    - The fire history is kept in memory and the shapefile is written once at the
+      end, also when the loop stops on an error (and every `flush_every` timestamps),
+      instead of being re-read and rewritten for every timestamp. An existing shapefile
+      is loaded and extended; once the file holds the history, later writes only append
+      the new records.
+    - `shapefile_path` may also be a GeoPackage (.gpkg) or a FlatGeobuf (.fgb): the format
+      follows the extension. Both keep full column names and are faster to write than a shapefile.
     - Errors are caught and printed but do not stop execution.
     """
     
@@ -78,99 +234,256 @@ def process_fire_grid(
     # split bbox into sub-bboxes
     n_rows, n_cols = compute_grid_for_bbox(bbox, pixel_size_m=pixel_size_m, base_px=base_px)
     sub_boxes = split_bbox(bbox, n_rows, n_cols)
+    blocks = list(_supertiles(sub_boxes, n_rows, n_cols, pixel_size_m, max_request_px))
+
+    print(f"🚀 Starting processing: {len(times)} timestamps × {len(sub_boxes)} sub-bboxes "
+          f"({len(blocks)} WMS requests per timestamp)")
 
-    print(f"🚀 Starting processing: {len(times)} timestamps × {len(sub_boxes)} sub-bboxes")
+    # 🌐 Connect once to WMS service, shared by all requests
+    wms = _get_wms(WMS_URL)
+
+    # 📚 Fire history kept in memory during the run
+    fires_gdf = read_fires(shapefile_path) if os.path.exists(shapefile_path) else None
+    written = (len(fires_gdf), tuple(fires_gdf.columns)) if fires_gdf is not None else None
+    pending_write = False
+
+    # ♻️ Content hash of each block at the previous timestamp and the tile results it gave
+    last_digests = {}
+    last_results = {}
 
     consecutive_false = 0
 
-    for i, time in enumerate(times, start=1):
-        print(f"\n⏱️ Time {i}/{len(times)} → {time}")
+    # 📡 Downloads run in their own pool, up to `prefetch` timestamps ahead of detection
+    prefetch = max(1, max_workers // len(blocks))
+    block_tiles = [[r * n_cols + c + 1 for r in rows for c in cols] for _, _, rows, cols in blocks]
+    downloads = {}
 
-        all_false_this_time = True
-        
-        polygons_this_time = []
-        areas_this_time = []
-
-        for j, sbox in enumerate(sub_boxes, start=1):
-            print(f"   📍 Sub-bbox {j}/{len(sub_boxes)}: {sbox}")
-            try:
-                res = fire_areas(sbox, time, detection_params=detection_params)
-                if res and res != "false_image" and res[0] is not None:
-                    polygons, areas, crs = res
-                    polygons_this_time.extend(polygons)
-                    areas_this_time.extend(areas)
-                    all_false_this_time = False
-                elif res == 'false_image':
-                    all_false_this_time = True
+    # 🧠 CPU-bound work (decode, masks, contours) releases the GIL: one thread per core is enough
+    # (or one process per core, when requested, for the parts that hold it)
+    cpu_workers = max(1, min(max_workers, os.cpu_count() or 1))
+    if use_processes:
+        # Spawned, not forked: fork would copy the download threads' locks (stdout included)
+        executor = ProcessPoolExecutor(max_workers=cpu_workers,
+                                       mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=cpu_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as io_executor, executor:
+
+        def submit_downloads(t):
+            if t < len(times) and t not in downloads:
+                downloads[t] = {
+                    io_executor.submit(_download_image, wms, block_bbox, times[t], size, cache_dir): k
+                    for k, (block_bbox, size, _, _) in enumerate(blocks)
+                }
+
+        try:
+            for i, time in enumerate(times, start=1):
+                print(f"\n⏱️ Time {i}/{len(times)} → {time}")
+
+                polygons_this_time = []
+                areas_this_time = []
+
+                # 🖼️ Download each block of the grid (and queue the next timestamps)
+                for t in range(i - 1, i + prefetch):
+                    submit_downloads(t)
+                fetches = downloads.pop(i - 1)
+
+                results = {}
+                decodes = {}
+                block_jobs = {}
+                for fetch in as_completed(fetches):
+                    k = fetches[fetch]
+                    try:
+                        digest, img_bytes = fetch.result()
+                    except Exception as e:
+                        last_digests.pop(k, None)
+                        for j in block_tiles[k]:
+                            results[j] = e
+                        continue
+
+                    if digest == last_digests.get(k):
+                        # Same frame as the previous timestamp: its polygons are already in the
+                        # history, only the blank/false status matters for the early stop.
+                        print(f"   ♻️ Block {k + 1}/{len(blocks)} unchanged since previous timestamp → skipped.")
+                        for j in block_tiles[k]:
+                            prev = last_results.get(j)
+                            results[j] = 'false_image' if isinstance(prev, str) and prev == 'false_image' else None
+                        continue
+
+                    block_bbox, size, rows, cols = blocks[k]
+                    if use_processes:
+                        # ⚙️ Whole block in one worker task: decode, blank check, tiles, detection
+                        job = executor.submit(_detect_block, img_bytes, block_bbox, size, len(rows),
+                                              len(cols), time, detection_params)
+                        block_jobs[job] = (k, digest)
+                        continue
+                    decode = executor.submit(load_image, img_bytes, bbox=block_bbox, size=size)
+                    decodes[decode] = (k, digest)
+
+                futures = {}
+                for decode in as_completed(decodes):
+                    k, digest = decodes[decode]
+                    _, _, rows, cols = blocks[k]
+                    try:
+                        rgb, transform, crs = decode.result()
+                    except Exception as e:
+                        last_digests.pop(k, None)
+                        for j in block_tiles[k]:
+                            results[j] = e
+                        continue
+                    last_digests[k] = digest
+
+                    # ⛔ Whole block blank: no need to split and check every tile
+                    if is_uniform_image(rgb):
+                        print(f"   ⚠️ Blank/uniform block {k + 1}/{len(blocks)} at {time} → skipped.")
+                        for j in block_tiles[k]:
+                            results[j] = 'false_image'
+                        continue
+
+                    # 🧩 Slice block into sub-bbox tiles and detect on each one
+                    tile_w, tile_h = rgb.shape[1] // len(cols), rgb.shape[0] // len(rows)
+                    tiles = split_image(rgb, transform, len(rows), len(cols), tile_w, tile_h)
+                    for j, (tile, tile_transform) in zip(block_tiles[k], tiles):
+                        print(f"   📍 Sub-bbox {j}/{len(sub_boxes)}: {tuple(sub_boxes[j - 1].tolist())}")
+                        future = executor.submit(detect_fire_polygons, tile, tile_transform, crs, time,
+                                                 detection_params=detection_params)
+                        futures[future] = j
+
+                for future in as_completed(futures):
+                    j = futures[future]
+                    try:
+                        results[j] = future.result()
+                    except Exception as e:
+                        results[j] = e
+
+                for job in as_completed(block_jobs):
+                    k, digest = block_jobs[job]
+                    try:
+                        tile_results = job.result()
+                    except Exception as e:
+                        last_digests.pop(k, None)
+                        for j in block_tiles[k]:
+                            results[j] = e
+                        continue
+                    last_digests[k] = digest
+
+                    if isinstance(tile_results, str) and tile_results == 'false_image':
+                        print(f"   ⚠️ Blank/uniform block {k + 1}/{len(blocks)} at {time} → skipped.")
+                        for j in block_tiles[k]:
+                            results[j] = 'false_image'
+                        continue
+
+                    for j, result in zip(block_tiles[k], tile_results):
+                        print(f"   📍 Sub-bbox {j}/{len(sub_boxes)}: {tuple(sub_boxes[j - 1].tolist())}")
+                        results[j] = result
+
+                last_results = results
+
+                false_count = 0
+                for j in sorted(results):
+                    res = results[j]
+                    if isinstance(res, Exception):
+                        print(f"   ❌ Error at {time}, sub-bbox {j}: {res}")
+                    elif isinstance(res, str) and res == 'false_image':
+                        false_count += 1
+                    elif res and res[0] is not None:
+                        polygons, areas, crs = res
+                        polygons_this_time.extend(polygons)
+                        areas_this_time.extend(areas)
+
+                # False frame only if every sub-bbox is blank (not just the last one)
+                all_false_this_time = false_count == len(sub_boxes)
+
+                if polygons_this_time:
+                    new_gdf = create_geodataframe(polygons_this_time, areas_this_time, 'EPSG:4326', time)
+
+                    if new_gdf.empty:
+                        print("⚠️ Warning: No wildfires were detected in the area for the dates range.")
+                        break
+
+                    # 📚 Create or update fire history
+                    if fires_gdf is None:
+                        fires_gdf = init_fire_history(new_gdf)
+                    else:
+                        fires_gdf = update_fire_history(fires_gdf, new_gdf)
+                    pending_write = True
+
+                if pending_write and i % flush_every == 0:
+                    written = _write_fires(fires_gdf, shapefile_path, written)
+                    pending_write = False
+
+                if all_false_this_time:
+                    consecutive_false += 1
+                    print(f"🔕 All sub-bboxes false image at {time} (consecutive={consecutive_false})")
                 else:
-                    all_false_this_time = False
-            except Exception as e:
-                print(f"   ❌ Error at {time}, sub-bbox {j}: {e}")
-                all_false_this_time = False
-
-        if polygons_this_time:
-            new_gdf = create_geodataframe(polygons_this_time, areas_this_time, 'EPSG:4326', time)
-
-            if new_gdf.empty:
-                print("⚠️ Warning: No wildfires were detected in the area for the dates range.")
-                return
-
-            # 💾 Create or update shapefile
-            if not os.path.exists(shapefile_path):
-                create_shapefile(new_gdf, shapefile_path)
-            else:
-                update_shapefile(new_gdf, shapefile_path)
-
-        if all_false_this_time:
-            consecutive_false += 1
-            print(f"🔕 All sub-bboxes false image at {time} (consecutive={consecutive_false})")
-        else:
-            consecutive_false = 0
-
-        if consecutive_false >= 2:
-            print("⛔ Two consecutive false image time iterations → stopping process early.")
-            break
-
-def fire_areas(bbox: tuple, date_str: str, detection_params: dict = None):
+                    consecutive_false = 0
+
+                if consecutive_false >= 2:
+                    print("⛔ Two consecutive false image time iterations → stopping process early.")
+                    break
+        finally:
+            # Early stop: drop the prefetched downloads that did not start yet
+            io_executor.shutdown(wait=False, cancel_futures=True)
+
+            # 💾 Write the rows still pending (whole history on the first write), also when
+            # the loop stops on an error or an interruption
+            if pending_write:
+                _write_fires(fires_gdf, shapefile_path, written)
+
+def fire_areas(bbox: tuple, date_str: str, detection_params: dict = None, wms: WebMapService = None,
+               cache_dir: str = None):
     """
     🔥 Wildfire monitoring using WMS images from EUMETSAT.
 
     This function downloads images from the EUMETSAT WMS service, detects
     burned areas, converts them into polygons.
 
+    An already connected `wms` can be passed; otherwise the process-wide cached
+    connection is used, so GetCapabilities is only requested once. With `cache_dir`
+    the GetMap response is read from / stored in that on-disk cache.
+
     Returns:
     - (polygons, areas, crs) if successful, None otherwise.
     """
     
+    # 🌐 Connect to WMS service
+    if wms is None:
+        wms = _get_wms(WMS_URL)
+
+    # 🖼️ Download image from WMS (bbox as plain floats, e.g. a row of `split_bbox`)
+    bbox = tuple(map(float, bbox))
+    size = calculate_image_size(bbox)
+    rgb, transform, crs = _fetch_image(wms, bbox, date_str, size, cache_dir)
+
+    return detect_fire_polygons(rgb, transform, crs, date_str, detection_params=detection_params)
+
+def detect_fire_polygons(rgb, transform, crs, date_str: str, detection_params: dict = None):
+    """
+    🧠 Detect burned areas on an already downloaded image and convert them into polygons.
+
+    Returns:
+    - 'false_image' if the image is blank/uniform.
+    - (polygons, areas, crs) if successful, None otherwise.
+    """
+    
     # Default detection settings
     params = {
         "method": "hsv",
         "upscale_factor": 4,
         "blur_sigma": 3.0,
         "threshold_value": 0.8,
-        "tol": 40
+        "tol": 40,
+        "engine": "auto",
+        "min_area_ha": 1.0,
+        "chain_approx": "simple",
+        "approx_epsilon": 0.5
     }
     if detection_params:
         params.update(detection_params)
-    
-    # 🌐 Source WMS (not edit)
-    WMS_URL = 'https://view.eumetsat.int/geoserver/wms'
-    TARGET_LAYER = 'mtg_fd:rgb_firetemperature'
-
-    # 🌐 Connect to WMS service
-    print("🔌 Connecting to WMS...")
-    wms = WebMapService(WMS_URL, version="1.3.0")
-
-    # 🖼️ Download image from WMS
-    size = calculate_image_size(bbox)
-    img_bytes = get_wms_image(wms, TARGET_LAYER, bbox, date_str, size)
-
-    # 🧠 Process image and get contours
-    rgb, transform, crs = load_image(img_bytes)
 
     # ⛔ Filter for white/false image
-    arr = np.array(rgb)
-    if arr.size == 0 or np.nanstd(arr) == 0 or np.nanmax(arr) == np.nanmin(arr):
+    if is_uniform_image(rgb):
         print(f"⚠️ Blank/uniform image detected at {date_str} → skipped.")
         return 'false_image'
     
@@ -181,14 +494,17 @@ def fire_areas(bbox: tuple, date_str: str, detection_params: dict = None):
         upscale_factor=params["upscale_factor"],
         blur_sigma=params["blur_sigma"],
         threshold_value=params["threshold_value"],
-        tol=params["tol"]
+        tol=params["tol"],
+        engine=params["engine"],
+        chain_approx=params["chain_approx"],
+        approx_epsilon=params["approx_epsilon"]
     )
     if not contours:
         print("⚠️ No contours detected.")
         return
 
     # 🔲 Generated polygons and create GeoDataFrame
-    polygons, areas = calculate_polygon_areas(contours, adjusted_transform)
+    polygons, areas = calculate_polygon_areas(contours, adjusted_transform, min_area_ha=params["min_area_ha"])
     if not polygons:
         print("⚠️ No valid polygons generated.")
         return
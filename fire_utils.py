@@ -1,28 +1,51 @@
 from affine import Affine
+from contextlib import contextmanager
 import cv2
-from datetime import timedelta
+from functools import lru_cache
 import geopandas as gpd
+import hashlib
+import importlib.util
+import os
 import pandas as pd
 import numpy as np
-from pyproj import Geod
+from pyproj import CRS, Geod
 from rasterio.io import MemoryFile
-from rasterio.transform import xy
-from shapely.geometry import Polygon
-from shapely.ops import unary_union
+from rasterio.transform import from_bounds
+import shapely
+from shapely import STRtree
+import threading
+
+try:  # optional: fused per-pixel mask kernels
+    from numba import njit
+except ImportError:
+    njit = None
 
 def generate_datetimes(start, end, step_minutes):
     """
-    Genera una lista de fechas a intervalos de 10 minutos entre `start` y `end`.
+    Genera una lista de fechas a intervalos de `step_minutes` minutos entre `start` y `end` (incluidos).
+
+    Las fechas se calculan de una vez con `np.arange` sobre `datetime64[s]` y se
+    devuelven en formato ISO con 'Z' ('YYYY-MM-DDTHH:MM:SSZ').
     """
-    current = start
-    times = []
-    while current <= end:
-        times.append(current.isoformat() + 'Z')  # Formato ISO con 'Z'
-        current += timedelta(minutes=step_minutes)
-    return times
+    start64 = np.datetime64(start, 's')
+    end64 = np.datetime64(end, 's') + np.timedelta64(1, 's')  # `end` incluido
+    step64 = np.timedelta64(int(step_minutes * 60), 's')
+    times = np.arange(start64, end64, step64)
+    return np.char.add(np.datetime_as_string(times, unit='s'), 'Z').tolist()  # Formato ISO con 'Z'
 
 ## BBOX -> GRID ##
 
+# WGS84 ellipsoid shared by every geodesic computation (sizes and areas)
+_GEOD = Geod(ellps="WGS84")
+
+@lru_cache(maxsize=32)
+def _bbox_size_m(bbox: tuple):
+    """Geodesic (width_m, height_m) of a bbox along its central parallel and meridian."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    _, _, width_m = _GEOD.inv(lon_min, (lat_min+lat_max)/2, lon_max, (lat_min+lat_max)/2)
+    _, _, height_m = _GEOD.inv((lon_min+lon_max)/2, lat_min, (lon_min+lon_max)/2, lat_max)
+    return width_m, height_m
+
 def compute_grid_for_bbox(bbox: tuple, pixel_size_m: float = 500.0, base_px: int = 500):
     """
     Divide a bounding box into rows and columns based on pixel resolution.
@@ -35,12 +58,8 @@ def compute_grid_for_bbox(bbox: tuple, pixel_size_m: float = 500.0, base_px: int
     Returns:
         (n_rows, n_cols): number of subdivisions in vertical and horizontal direction.
     """
-    lon_min, lat_min, lon_max, lat_max = bbox
-    geod = Geod(ellps="WGS84")
-
     # dimensiones del bbox en metros
-    _, _, width_m = geod.inv(lon_min, (lat_min+lat_max)/2, lon_max, (lat_min+lat_max)/2)
-    _, _, height_m = geod.inv((lon_min+lon_max)/2, lat_min, (lon_min+lon_max)/2, lat_max)
+    width_m, height_m = _bbox_size_m(tuple(map(float, bbox)))
 
     sub_width_m = base_px * pixel_size_m
     sub_height_m = base_px * pixel_size_m
@@ -51,63 +70,118 @@ def compute_grid_for_bbox(bbox: tuple, pixel_size_m: float = 500.0, base_px: int
     return n_rows, n_cols
 
 def split_bbox(bbox, n_rows, n_cols):
+    """
+    Split a bounding box into a regular grid of sub-bboxes.
+
+    Args:
+        bbox (tuple): (lon_min, lat_min, lon_max, lat_max).
+        n_rows (int): number of subdivisions in vertical direction.
+        n_cols (int): number of subdivisions in horizontal direction.
+
+    Returns:
+        sub_boxes (np.ndarray): (n_rows * n_cols, 4) array of (x0, y0, x1, y1) edges,
+        row by row from the south-west corner. Use `map(tuple, sub_boxes)` for tuples.
+    """
     xmin, ymin, xmax, ymax = bbox
-    dx = (xmax - xmin) / n_cols
-    dy = (ymax - ymin) / n_rows
+    xs = np.linspace(xmin, xmax, n_cols + 1)
+    ys = np.linspace(ymin, ymax, n_rows + 1)
+
+    x0, y0 = np.meshgrid(xs[:-1], ys[:-1])
+    x1, y1 = np.meshgrid(xs[1:], ys[1:])
+    return np.column_stack([x0.ravel(), y0.ravel(), x1.ravel(), y1.ravel()])
+
+def split_image(rgb: np.ndarray, transform, n_rows: int, n_cols: int, tile_w: int, tile_h: int):
+    """
+    Slice an image covering a whole grid into per-sub-bbox tiles.
+
+    Tiles are returned in the same order as `split_bbox` (rows from south to north),
+    as zero-copy views of `rgb` together with their own affine transform.
 
-    sub_boxes = []
+    Args:
+        rgb (np.ndarray): RGB image (n_rows * tile_h, n_cols * tile_w, 3).
+        transform (Affine): Affine transform of the whole image.
+        n_rows (int): Number of sub-bbox rows covered by the image.
+        n_cols (int): Number of sub-bbox columns covered by the image.
+        tile_w (int): Width of each tile in pixels.
+        tile_h (int): Height of each tile in pixels.
+
+    Returns:
+        tiles (List[Tuple[np.ndarray, Affine]]): (tile, tile_transform) for each sub-bbox.
+    """
+    tiles = []
     for i in range(n_rows):
+        # image rows start at the north edge, sub-bbox rows at the south edge
+        r0 = (n_rows - 1 - i) * tile_h
         for j in range(n_cols):
-            x0 = xmin + j * dx
-            y0 = ymin + i * dy
-            x1 = x0 + dx
-            y1 = y0 + dy
-            sub_boxes.append((x0, y0, x1, y1))
-    return sub_boxes
+            c0 = j * tile_w
+            tile = rgb[r0:r0 + tile_h, c0:c0 + tile_w]
+            tiles.append((tile, transform * Affine.translation(c0, r0)))
+    return tiles
 
 ## WMS IMAGE DOWNLOAD UTILITIES ##
 
 def calculate_image_size(bbox:tuple, pixel_size_m:float=500.0):
     """
-    Calculate the aspect ratio of the image based in bbox.
+    Calculate the image size of the bbox from its geodesic width and height.
 
     Parameters:
     bbox (tuple): bounding box of the area of interest in format (lon_min, lat_min, lon_max, lat_max)
+    pixel_size_m (float): target pixel resolution in meters (default=500).
 
     Returns:
-    tuple: (width, height) in pixels.
+    tuple: (width, height) in pixels, at least 1 each (degenerate or tiny bboxes).
     """
-    lon_min, lat_min, lon_max, lat_max = bbox
-    geod = Geod(ellps="WGS84")
+    width_m, height_m = _bbox_size_m(tuple(map(float, bbox)))
 
-    _, _, width_m = geod.inv(lon_min, (lat_min+lat_max)/2,
-                             lon_max, (lat_min+lat_max)/2)
-
-    _, _, height_m = geod.inv((lon_min+lon_max)/2, lat_min,
-                              (lon_min+lon_max)/2, lat_max)
-
-    width_px = int(round(width_m / pixel_size_m))
-    height_px = int(round(height_m / pixel_size_m))
+    width_px = max(1, int(round(width_m / pixel_size_m)))
+    height_px = max(1, int(round(height_m / pixel_size_m)))
 
     return (width_px, height_px)
 
-def get_wms_image(wms:str, target_layer:str, bbox:tuple, time:str, size:tuple, epsg='EPSG:4326', format='image/geotiff'):
+def get_wms_image(wms:str, target_layer:str, bbox:tuple, time:str, size:tuple, epsg='EPSG:4326', format='image/geotiff',
+                  cache_dir:str=None):
     """
     Request an image from a WMS (Web Map Service) server using the GetMap request.
 
     Arguments:
     - wms (str): URL of the Web Map Service.
     - target_layer (str): Name of the target layer to request from the WMS.
-    - bbox (tuple): Bounding box in the format (lon_min, lat_min, lon_max, lat_max).
+    - bbox (tuple): Bounding box in the format (lon_min, lat_min, lon_max, lat_max), any sequence of 4 numbers.
     - time (str): Timestamp for the requested data in the format 'YYYY-MM-DDTHH:MM:SSZ'.
     - size (tuple): Output image size in pixels as (width_px, height_px).
     - epsg (str): Coordinate reference system identifier (default is 'EPSG:4326').
     - format (str): Image output format (default is 'image/geotiff').
+    - cache_dir (str, optional): Directory of an on-disk cache of responses (default None, disabled).
 
     Returns:
     - bytes: The raw image data returned by the WMS server using the GetMap request.
+
+    Notes:
+    - Responses are not memoized in-process: a frame requested before the server publishes
+      it must be downloaded again on the next run, and block responses are large.
+    - With `cache_dir`, responses are stored in one file per request, named by the
+      SHA-256 of (url, layer, bbox, time, size, epsg, format), and reruns read them back
+      without contacting the server. Frames requested before the server publishes them
+      are cached as returned, so only cache past time ranges.
     """
 
+    # Plain tuples: bbox may come as a NumPy row of `split_bbox`
+    bbox = tuple(map(float, bbox))
+    size = tuple(map(int, size))
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+        key = (getattr(wms, "url", None), target_layer, bbox, time, size, epsg, format)
+        cache_path = os.path.join(cache_dir, hashlib.sha256(repr(key).encode()).hexdigest())
+        try:
+            with open(cache_path, "rb") as cached:
+                img_bytes = cached.read()
+            print(f"🗄️ Image for {time} read from cache.")
+            return img_bytes
+        except FileNotFoundError:
+            pass
+
     print(f"📥 Request image for: {time}")
     try:
         img = wms.getmap(
@@ -120,88 +194,314 @@ def get_wms_image(wms:str, target_layer:str, bbox:tuple, time:str, size:tuple, e
             format=format,
             transparent=True
         )
+        img_bytes = img.read()
     except Exception as error:
         print(f"❌ Request error for {time}:\n{error}")
+        raise
 
     print(f"✅ Image for {time} download succesfull.")
-    return img
 
-def load_image(img_bytes):
+    if cache_path is not None:
+        # Written under a temporary name and renamed: concurrent readers never see partial files
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as cached:
+                cached.write(img_bytes)
+            os.replace(tmp_path, cache_path)
+        except OSError as error:
+            print(f"⚠️ Could not cache image for {time}: {error}")
+    return img_bytes
+
+# OpenCV's log level is process-wide: decoding threads share one lowered level
+_cv_log_lock = threading.Lock()
+_cv_log_users = 0
+_cv_log_saved = None
+
+@contextmanager
+def _opencv_errors_only():
+    """
+    Only let OpenCV log errors inside the block (libtiff warns about every GeoTIFF tag).
+
+    The previous level is saved when the first thread enters and restored when the last
+    one leaves, so the host application (e.g. QGIS) keeps its own level outside decoding.
+    """
+    global _cv_log_users, _cv_log_saved
+    with _cv_log_lock:
+        if _cv_log_users == 0:
+            _cv_log_saved = cv2.utils.logging.getLogLevel()
+            cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_ERROR)
+        _cv_log_users += 1
+    try:
+        yield
+    finally:
+        with _cv_log_lock:
+            _cv_log_users -= 1
+            if _cv_log_users == 0:
+                cv2.utils.logging.setLogLevel(_cv_log_saved)
+
+def _decode_rgb(img_bytes):
+    """
+    Decode 8-bit RGB(A) image bytes with OpenCV into an (H, W, 3) RGB array.
+
+    Returns None when rasterio must be used instead: undecodable data, other dtypes or
+    band counts, or an alpha band that is not fully opaque (its colors come premultiplied).
+    """
+    buffer = np.frombuffer(img_bytes, np.uint8)  # zero-copy view of the response bytes
+    with _opencv_errors_only():
+        img = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    if img is None or img.dtype != np.uint8 or img.ndim != 3:
+        return None
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if img.shape[2] == 4 and cv2.minMaxLoc(cv2.extractChannel(img, 3))[0] == 255:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
+    return None
+
+def load_image(img_bytes, bbox:tuple=None, size:tuple=None, epsg='EPSG:4326'):
     """
     Load an image from WMS binary data and return its RGB array, affine transform, and CRS.
 
     Arguments:
     - img_bytes (bytes): Binary image data returned by a WMS GetMap request (e.g., GeoTIFF format).
+    - bbox (tuple, optional): Bounding box used in the GetMap request (lon_min, lat_min, lon_max, lat_max).
+    - size (tuple, optional): Image size used in the GetMap request (width_px, height_px).
+    - epsg (str): Coordinate reference system of the request (default is 'EPSG:4326').
 
     Returns:
     - rgb (np.ndarray): 3D NumPy array representing the RGB image (uint8).
     - transform (Affine): Affine transformation mapping pixel coordinates to spatial coordinates.
     - crs (CRS): Coordinate Reference System of the image.
+
+    Notes:
+    - When `bbox` and `size` are known, the image is decoded with OpenCV (no GDAL virtual
+      file) and the georeferencing is rebuilt from the request parameters. Otherwise, or if
+      OpenCV cannot decode the data, it is read with rasterio from the file metadata.
+    - Images with a transparent alpha band are also read with rasterio: OpenCV's TIFF
+      decoder premultiplies color by alpha, which would blacken no-data areas.
     """
+    if bbox is not None and size is not None:
+        rgb = _decode_rgb(img_bytes)
+        if rgb is not None and rgb.shape[1::-1] == tuple(size):
+            transform = from_bounds(*bbox, size[0], size[1])
+            return rgb, transform, get_crs(epsg)
+
     with MemoryFile(img_bytes) as memfile:
         with memfile.open() as dataset:
-            r = dataset.read(1)
-            g = dataset.read(2)
-            b = dataset.read(3)
-            rgb = np.dstack((r, g, b)).astype(np.uint8)
+            # All three bands in one read (3, H, W), interleaved to (H, W, 3) by OpenCV's SIMD merge
+            bands = dataset.read((1, 2, 3), out_dtype=np.uint8)
+            rgb = cv2.merge(tuple(bands))
             transform = dataset.transform
             crs = dataset.crs
     return rgb, transform, crs
 
+def is_uniform_image(rgb: np.ndarray, stride: int = 16) -> bool:
+    """
+    Check whether an image is empty or has a single value everywhere (blank/false WMS image).
+
+    A strided sample is tested first: any variation there proves the image is not
+    uniform without scanning every pixel. Only a uniform sample is confirmed on the full image.
+
+    Arguments:
+    - rgb (np.ndarray): RGB image (H, W, 3), uint8 as returned by `load_image`.
+    - stride (int): Sampling step in rows and columns for the quick check (default=16).
+
+    Returns:
+    - bool: True if the image is empty or uniform.
+    """
+    if rgb.size == 0:
+        return True
+    if np.ptp(rgb[::stride, ::stride]) != 0:
+        return False
+    return np.ptp(rgb) == 0
+
 ## DETECTION AND CALCULATION OF AREAS OF INTEREST ##
 
-def create_mask_rgb(rgb: np.ndarray, tol: int = 40) -> np.ndarray:
+def _range_tables(lowers, uppers) -> np.ndarray:
+    """
+    Per-channel bit tables of a union of (lower, upper) boxes (at most 8).
+
+    Bit k of table[c, x] is set when value x of channel c lies in box k, so a pixel
+    matches some box exactly when table[0, a] & table[1, b] & table[2, c] != 0.
+    """
+    values = np.arange(256)
+    table = np.zeros((3, 256), dtype=np.uint8)
+    for k, (lower, upper) in enumerate(zip(lowers, uppers)):
+        for c in range(3):
+            table[c, (values >= lower[c]) & (values <= upper[c])] |= np.uint8(1 << k)
+    return table
+
+if njit is not None:
+    @njit(nogil=True, cache=True)
+    def _mask_in_ranges(img, table):
+        """Single pass over a 3-channel uint8 image: 255 where any box of `table` matches."""
+        h, w = img.shape[0], img.shape[1]
+        out = np.empty((h, w), dtype=np.uint8)
+        for i in range(h):
+            for j in range(w):
+                bits = table[0, img[i, j, 0]] & table[1, img[i, j, 1]] & table[2, img[i, j, 2]]
+                out[i, j] = 255 if bits else 0
+        return out
+
+    # Reciprocal tables of OpenCV's 8-bit RGB2HSV (Q12 fixed point): no division per pixel
+    _HSV_SHIFT = 12
+    _SDIV_TABLE = np.zeros(256, dtype=np.int32)
+    _SDIV_TABLE[1:] = np.rint((255 << _HSV_SHIFT) / np.arange(1, 256))
+    _HDIV_TABLE = np.zeros(256, dtype=np.int32)
+    _HDIV_TABLE[1:] = np.rint((180 << _HSV_SHIFT) / (6.0 * np.arange(1, 256)))
+
+    @njit(nogil=True, cache=True)
+    def _mask_hsv_ranges(rgb, table, rgb_table, sdiv, hdiv, shift):
+        """
+        Single pass RGB -> HSV -> range test, without materializing the HSV image.
+
+        The conversion reproduces OpenCV's 8-bit COLOR_RGB2HSV fixed-point arithmetic
+        (H in 0–179, same reciprocal tables), so the mask is identical to cvtColor + inRange.
+        Pixels matching `rgb_table` on their RGB values are also set (all zeros: HSV only),
+        which fuses the 'combined' method into the same pass. `sdiv`/`hdiv` are the reciprocal
+        tables and `shift` their fixed-point precision (_SDIV_TABLE, _HDIV_TABLE, _HSV_SHIFT).
+        """
+        half = 1 << (shift - 1)
+        h, w = rgb.shape[0], rgb.shape[1]
+        out = np.empty((h, w), dtype=np.uint8)
+        for i in range(h):
+            for j in range(w):
+                r = np.int32(rgb[i, j, 0])
+                g = np.int32(rgb[i, j, 1])
+                b = np.int32(rgb[i, j, 2])
+                v = max(r, g, b)
+                diff = v - min(r, g, b)
+
+                sat = (diff * sdiv[v] + half) >> shift
+
+                hue = 0
+                if diff > 0:
+                    if v == r:
+                        hue = g - b
+                    elif v == g:
+                        hue = b - r + 2 * diff
+                    else:
+                        hue = r - g + 4 * diff
+                    hue = (hue * hdiv[diff] + half) >> shift
+                    if hue < 0:
+                        hue += 180
+
+                bits = table[0, hue] & table[1, sat] & table[2, v]
+                bits |= rgb_table[0, r] & rgb_table[1, g] & rgb_table[2, b]
+                out[i, j] = 255 if bits else 0
+        return out
+
+def _use_numba(engine: str) -> bool:
+    if engine == "auto":
+        return njit is not None
+    if engine == "numba":
+        if njit is None:
+            raise ImportError("engine='numba' requires the optional 'numba' package.")
+        return True
+    if engine in ("opencv", "opencl"):
+        return False
+    raise ValueError(f"Invalid engine '{engine}'. Use 'auto', 'numba', 'opencv' or 'opencl'.")
+
+# Reference colors of the EUMETSAT Fire Temperature RGB guide
+_FIRE_RGB_COLORS = {
+    "warm": (254, 40, 40),        # warm fire / hot spot
+    "very_warm": (255, 192, 0),   # very warm fire
+    "hot": (255, 255, 0),         # hot fire
+    "extreme": (255, 255, 255)    # extreme intense fire
+}
+
+# HSV ranges (OpenCV 8-bit: H 0–179) of the fire colors
+_FIRE_HSV_RANGES = [
+    (np.array([0, 120, 150], np.uint8),  np.array([15, 255, 255], np.uint8)),   # warm fire (red-orange)
+    (np.array([20, 120, 150], np.uint8), np.array([60, 255, 255], np.uint8)),   # yellow fires
+    (np.array([0, 0, 230], np.uint8),    np.array([179, 50, 255], np.uint8))    # extreme (white)
+]
+
+# Bit tables of the numba kernels that do not depend on any parameter, built once
+_FIRE_HSV_TABLE = _range_tables(*zip(*_FIRE_HSV_RANGES))
+_NO_RANGES_TABLE = np.zeros((3, 256), dtype=np.uint8)
+
+@lru_cache(maxsize=32)
+def _fire_rgb_boxes(tol: int):
+    """(lowers, uppers) uint8 boxes of ±`tol` around each reference fire color (cached, read-only)."""
+    refs = np.array(list(_FIRE_RGB_COLORS.values()))
+    lowers = np.clip(refs - tol, 0, 255).astype(np.uint8)
+    uppers = np.clip(refs + tol, 0, 255).astype(np.uint8)
+    return lowers, uppers
+
+@lru_cache(maxsize=32)
+def _fire_rgb_table(tol: int) -> np.ndarray:
+    """Bit table of the RGB boxes for `tol` (cached, read-only)."""
+    return _range_tables(*_fire_rgb_boxes(tol))
+
+def create_mask_rgb(rgb: np.ndarray, tol: int = 40, engine: str = "auto") -> np.ndarray:
     """
     Create a fire mask based on RGB thresholds from the EUMETSAT Fire Temperature RGB guide.
 
     Args:
-        rgb (np.ndarray): RGB image (H, W, 3).
+        rgb (np.ndarray | cv2.UMat): RGB image (H, W, 3).
         tol (int): Tolerance per channel (default=40).
+        engine (str): 'numba' (fused single pass), 'opencv'/'opencl' (inRange per color)
+            or 'auto' (default, numba when installed).
 
     Returns:
         mask_rgb (np.ndarray): Binary mask (0/255).
     """
-    fire_colors = {
-        "warm": (254, 40, 40),        # warm fire / hot spot
-        "very_warm": (255, 192, 0),   # very warm fire
-        "hot": (255, 255, 0),         # hot fire
-        "extreme": (255, 255, 255)    # extreme intense fire
-    }
+    lowers, uppers = _fire_rgb_boxes(tol)
 
-    mask_rgb = np.zeros(rgb.shape[:2], dtype=np.uint8)
-    for ref in fire_colors.values():
-        lower = np.clip(np.array(ref) - tol, 0, 255).astype(np.uint8)
-        upper = np.clip(np.array(ref) + tol, 0, 255).astype(np.uint8)
-        mask_rgb |= cv2.inRange(rgb, lower, upper)
+    if _use_numba(engine):
+        return _mask_in_ranges(rgb, _fire_rgb_table(tol))
 
-    return mask_rgb
+    # First color written straight into the mask, the rest OR-ed in through one reused
+    # buffer (allocated by the first inRange, so it also works on a cv2.UMat)
+    mask_rgb = cv2.inRange(rgb, lowers[0], uppers[0])
+    in_range = None
+    for lower, upper in zip(lowers[1:], uppers[1:]):
+        in_range = cv2.inRange(rgb, lower, upper, dst=in_range)
+        mask_rgb = cv2.bitwise_or(mask_rgb, in_range, dst=mask_rgb)
 
+    return mask_rgb
 
-def create_mask_hsv(rgb: np.ndarray) -> np.ndarray:
+def create_mask_hsv(rgb: np.ndarray, engine: str = "auto") -> np.ndarray:
     """
     Create a fire mask based on HSV ranges (tone/saturation/value).
 
     Args:
-        rgb (np.ndarray): RGB image (H, W, 3).
+        rgb (np.ndarray | cv2.UMat): RGB image (H, W, 3).
+        engine (str): 'numba' (fused RGB→HSV + ranges in one pass), 'opencv'/'opencl'
+            (cvtColor + inRange per range) or 'auto' (default, numba when installed).
 
     Returns:
         mask_hsv (np.ndarray): Binary mask (0/255).
     """
-    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
-    ranges_hsv = [
-        (np.array([0, 120, 150]),  np.array([15, 255, 255])),   # warm fire (red-orange)
-        (np.array([20, 120, 150]), np.array([60, 255, 255])),   # yellow fires
-        (np.array([0, 0, 230]),    np.array([179, 50, 255]))    # extreme (white)
-    ]
+    ranges_hsv = _FIRE_HSV_RANGES
 
-    mask_hsv = np.zeros(rgb.shape[:2], dtype=np.uint8)
-    for lower, upper in ranges_hsv:
-        mask_hsv |= cv2.inRange(hsv, lower, upper)
+    if _use_numba(engine):
+        return _mask_hsv_ranges(rgb, _FIRE_HSV_TABLE, _NO_RANGES_TABLE, _SDIV_TABLE, _HDIV_TABLE, _HSV_SHIFT)
+
+    # uint8 HSV (SIMD cvtColor); first range written straight into the mask, the rest OR-ed in
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    (lower, upper), *other_ranges = ranges_hsv
+    mask_hsv = cv2.inRange(hsv, lower, upper)
+    in_range = None
+    for lower, upper in other_ranges:
+        in_range = cv2.inRange(hsv, lower, upper, dst=in_range)
+        mask_hsv = cv2.bitwise_or(mask_hsv, in_range, dst=mask_hsv)
 
     return mask_hsv
 
+# 3x3 structuring element of the noise-cleaning opening, built once
+_MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# Contour chain approximations accepted by detect_areas
+_CHAIN_APPROX = {
+    "simple": cv2.CHAIN_APPROX_SIMPLE,
+    "tc89_kcos": cv2.CHAIN_APPROX_TC89_KCOS,
+}
+
 def detect_areas(rgb: np.ndarray, transform, method: str = "hsv",
-                 upscale_factor=4, blur_sigma=3.0, threshold_value=0.8, tol: int = 40):
+                 upscale_factor=4, blur_sigma=3.0, threshold_value=0.8, tol: int = 40,
+                 engine: str = "auto", approx_epsilon: float = 0.5, chain_approx: str = "simple"):
     """
     Detect fire areas from an RGB image using RGB, HSV, or combined masks.
 
@@ -210,53 +510,126 @@ def detect_areas(rgb: np.ndarray, transform, method: str = "hsv",
         transform (Affine): Affine transform of the original image.
         method (str): 'rgb', 'hsv' (default), or 'combined'.
         upscale_factor (int): Scaling factor to simulate subpixel resolution (default=4).
-        blur_sigma (float): Sigma value for Gaussian blur (default=3.0).
+        blur_sigma (float): Sigma value for Gaussian blur, in upscaled pixels (default=3.0).
         threshold_value (float): Threshold value (0–1) for the blurred mask (default=0.8).
         tol (int): RGB tolerance (default=40, only for method='rgb' or 'combined').
+        engine (str): Mask kernel, 'auto' (default), 'numba' or 'opencv'. 'opencl' runs the
+            whole OpenCV pipeline on cv2.UMat (T-API) when an OpenCL device is available.
+        approx_epsilon (float): Douglas-Peucker tolerance applied to the contours, in upscaled
+            pixels (default=0.5, 0 keeps every contour vertex).
+        chain_approx (str): Contour tracing approximation, 'simple' (default, drops collinear
+            vertices only) or 'tc89_kcos' (Teh-Chin: fewer vertices, slightly larger areas).
 
     Returns:
         contours (List[np.ndarray]): OpenCV contours [(N,1,2)] in geographic coordinates.
         adjusted_transform: Transform adjusted for upscaling.
     """
+    if chain_approx not in _CHAIN_APPROX:
+        raise ValueError(f"Invalid chain_approx '{chain_approx}'. Use 'simple' or 'tc89_kcos'.")
+
+    # 🎮 OpenCL offload: every cv2 call below accepts a UMat and stays on the device
+    if engine == "opencl" and cv2.ocl.haveOpenCL():
+        rgb = cv2.UMat(rgb)
+
     # --- Choose mask type ---
     if method == "rgb":
-        mask_total = create_mask_rgb(rgb, tol=tol)
+        mask_total = create_mask_rgb(rgb, tol=tol, engine=engine)
     elif method == "hsv":
-        mask_total = create_mask_hsv(rgb)
+        mask_total = create_mask_hsv(rgb, engine=engine)
+    elif method == "combined" and _use_numba(engine):
+        # Fused: HSV ranges and RGB boxes tested in the same pass over the image
+        mask_total = _mask_hsv_ranges(rgb, _FIRE_HSV_TABLE, _fire_rgb_table(tol), _SDIV_TABLE, _HDIV_TABLE, _HSV_SHIFT)
     elif method == "combined":
-        mask_total = cv2.bitwise_or(create_mask_rgb(rgb, tol=tol),
-                                    create_mask_hsv(rgb))
+        mask_total = cv2.bitwise_or(create_mask_rgb(rgb, tol=tol, engine=engine),
+                                    create_mask_hsv(rgb, engine=engine))
     else:
         raise ValueError(f"Invalid method '{method}'. Use 'rgb', 'hsv' or 'combined'.")
 
-    # Clean small noise
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
-
-    # Step 1: Convert to float32 and normalize
-    mask_f = mask_total.astype(np.float32) / 255.0
-
-    # Step 2: Upscale to simulate subpixels and adjust transform
     if upscale_factor > 1:
-        mask_f = cv2.resize(mask_f, None, fx=upscale_factor, fy=upscale_factor,
-                            interpolation=cv2.INTER_CUBIC)
         adjusted_transform = transform * Affine.scale(1 / upscale_factor, 1 / upscale_factor)
     else:
         adjusted_transform = transform
 
-    # Step 3: Apply Gaussian blur to generate soft edges
-    mask_f = cv2.GaussianBlur(mask_f, (0, 0), sigmaX=blur_sigma, sigmaY=blur_sigma)
+    # 🚫 Most frames have no fire pixels: an empty mask stays empty through the opening,
+    # blur, resize and threshold, so the full-frame passes are skipped (one SIMD count)
+    if cv2.countNonZero(mask_total) == 0:
+        return [], adjusted_transform
+
+    # Clean small noise (isolated pixels vanish here, so count again before upscaling)
+    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, _MORPH_KERNEL)
+    if cv2.countNonZero(mask_total) == 0:
+        return [], adjusted_transform
 
-    # Step 4: Threshold to simulate soft boundary
-    _, mask_thresh = cv2.threshold(mask_f, threshold_value, 1.0, cv2.THRESH_BINARY)
+    # The whole pipeline stays in uint8 (0–255): a quarter of the bytes of float32 and
+    # more SIMD lanes per vector for blur, resize and threshold.
 
-    # Step 5: Convert back to uint8 for contour detection
-    mask_uint8 = (mask_thresh * 255).astype(np.uint8)
+    # Step 1: Apply Gaussian blur to generate soft edges
+    # Blurring at native resolution with σ / upscale_factor is equivalent to blurring
+    # the upscaled mask with σ, at 1/upscale_factor² of the cost.
+    # (separable SIMD filter; ±3σ support, independent of the mask dtype)
+    sigma = blur_sigma / max(upscale_factor, 1)
+    ksize = 2 * int(np.ceil(3 * sigma)) + 1
+    mask_soft = cv2.GaussianBlur(mask_total, (ksize, ksize), sigmaX=sigma, sigmaY=sigma)
+
+    # Step 2: Upscale the soft mask to simulate subpixels (transform adjusted above)
+    if upscale_factor > 1:
+        mask_soft = cv2.resize(mask_soft, None, fx=upscale_factor, fy=upscale_factor,
+                               interpolation=cv2.INTER_CUBIC)
+
+    # Step 3: Threshold (0–1 value scaled to 0–255) to simulate soft boundary
+    thresh_u8 = int(round(threshold_value * 255))
+    _, mask_uint8 = cv2.threshold(mask_soft, thresh_u8, 255, cv2.THRESH_BINARY)
+    if isinstance(mask_uint8, cv2.UMat):
+        mask_uint8 = mask_uint8.get()
+
+    # Step 4: Get contours from smooth mask
+    # (CHAIN_APPROX_SIMPLE drops the collinear vertices of straight pixel runs; TC89_KCOS
+    # also cuts the staircase corners, leaving fewer vertices for approxPolyDP)
+    contours, _ = cv2.findContours(mask_uint8, cv2.RETR_EXTERNAL, _CHAIN_APPROX[chain_approx])
+
+    # Sub-pixel Douglas-Peucker in C: drops the staircase vertices before they reach shapely
+    if approx_epsilon > 0:
+        contours = [cv2.approxPolyDP(c, approx_epsilon, True) for c in contours]
 
-    # Step 6: Get contours from smooth mask
-    contours, _ = cv2.findContours(mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    
     return contours, adjusted_transform
 
+def pixels_to_coords(transform, cols, rows) -> np.ndarray:
+    """
+    Convert pixel indices to the coordinates of the pixel centers, as `rasterio.transform.xy`
+    does, but for whole arrays at once.
+
+    Arguments:
+    - transform (Affine): Affine transform of the image.
+    - cols, rows (np.ndarray): Pixel column (x) and row (y) indices.
+
+    Returns:
+    - coords (np.ndarray): (N, 2) array of (x, y) = (lon, lat) coordinates.
+    """
+    pix = np.column_stack([cols, rows]).astype(np.float64) + 0.5
+    linear = np.array([[transform.a, transform.d], [transform.b, transform.e]])
+    return pix @ linear + (transform.c, transform.f)
+
+# Authalic radius of WGS84 (sphere with the same surface as the ellipsoid)
+_AUTHALIC_RADIUS_M = 6_371_007.2
+
+def _ring_bbox_area_ha(coords, sizes) -> np.ndarray:
+    """
+    Upper bound of the area (ha) of each ring: spherical area of its lon/lat bounding box,
+    with a 2% margin for the sphere vs ellipsoid difference.
+
+    Arguments:
+    - coords (np.ndarray): (N, 2) lon/lat vertices of all rings, ring after ring.
+    - sizes (List[int]): Number of vertices of each ring.
+    """
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    lon_min = np.minimum.reduceat(coords[:, 0], starts)
+    lon_max = np.maximum.reduceat(coords[:, 0], starts)
+    lat_min = np.minimum.reduceat(coords[:, 1], starts)
+    lat_max = np.maximum.reduceat(coords[:, 1], starts)
+    area_m2 = (_AUTHALIC_RADIUS_M ** 2 * np.radians(lon_max - lon_min)
+               * np.abs(np.sin(np.radians(lat_max)) - np.sin(np.radians(lat_min))))
+    return 1.02 * area_m2 / 10_000
+
 def calculate_polygon_areas(contours, transform, min_area_ha:float=1.0, simplify_tolerance:float=0.001):
     """
     Convert pixel-based contours into georeferenced polygons, simplify geometry, and calculate area in hectares.
@@ -274,29 +647,42 @@ def calculate_polygon_areas(contours, transform, min_area_ha:float=1.0, simplify
 
     polygons = []
     areas = []
-    geod = Geod(ellps="WGS84")
-
-    for contour in contours:
-        coords_pix = contour[:, 0, :]
-        coords_geo = [xy(transform, int(y), int(x)) for x, y in coords_pix]
-
-        # Ensure that contour is closed
-        if coords_geo[0] != coords_geo[-1]:
-            coords_geo.append(coords_geo[0])
-
-        poly = Polygon(coords_geo)
-
-        if not poly.is_valid or poly.is_empty:
-            continue
-
-        # 🎯 SIMPLIFY poligon
-        poly_simple = poly.simplify(simplify_tolerance, preserve_topology=True)
-
-        if not poly_simple.is_valid or poly_simple.is_empty:
-            continue
 
-        # Calculate area
-        area_m2, _ = geod.geometry_area_perimeter(poly_simple)
+    contours = [c for c in contours if len(c) >= 3]  # a ring needs at least 3 vertices
+    if not contours:
+        return polygons, areas
+
+    # Transform the vertices of all contours at once, then build every ring in one GEOS call
+    sizes = [len(c) for c in contours]
+    coords_pix = np.concatenate(contours).reshape(-1, 2)
+    coords_geo = pixels_to_coords(transform, coords_pix[:, 0], coords_pix[:, 1])
+    ring_index = np.repeat(np.arange(len(contours)), sizes)
+
+    # ⚡ Cheap prefilter: simplify keeps a subset of the vertices, so no polygon can outgrow
+    # the lon/lat box of its ring. Rings whose box is already below `min_area_ha` are dropped.
+    keep = _ring_bbox_area_ha(coords_geo, sizes) >= min_area_ha
+    if not keep.any():
+        return polygons, areas
+    if not keep.all():
+        coords_geo = coords_geo[keep[ring_index]]
+        ring_index = np.repeat(np.arange(keep.sum()), np.asarray(sizes)[keep])
+
+    polys = shapely.polygons(shapely.linearrings(coords_geo, indices=ring_index))  # rings closed by shapely
+
+    polys = polys[shapely.is_valid(polys) & ~shapely.is_empty(polys)]
+
+    # 🎯 SIMPLIFY poligons
+    simplified = shapely.simplify(polys, simplify_tolerance, preserve_topology=True)
+    simplified = simplified[shapely.is_valid(simplified) & ~shapely.is_empty(simplified)]
+
+    if not len(simplified):
+        return polygons, areas
+
+    # Calculate areas straight from the exterior rings (contour polygons have no holes)
+    coords, ring_index = shapely.get_coordinates(shapely.get_exterior_ring(simplified), return_index=True)
+    ring_sizes = np.bincount(ring_index, minlength=len(simplified))
+    for poly_simple, ring in zip(simplified, np.split(coords, np.cumsum(ring_sizes)[:-1])):
+        area_m2, _ = _GEOD.polygon_area_perimeter(ring[:, 0], ring[:, 1])
         area_ha = abs(area_m2) / 10_000  # m² → ha
 
         if area_ha >= min_area_ha:
@@ -307,6 +693,28 @@ def calculate_polygon_areas(contours, transform, min_area_ha:float=1.0, simplify
 
 ## SHAPEFILE WORKFLOW ##
 
+# Vector I/O through pyogrio (bulk GDAL C API); Arrow transfer when pyarrow is installed
+_VECTOR_IO = {"engine": "pyogrio", "use_arrow": importlib.util.find_spec("pyarrow") is not None}
+
+def read_fires(path: str) -> gpd.GeoDataFrame:
+    """Read a fire history file (.shp, .gpkg, .fgb, ...) with pyogrio."""
+    return gpd.read_file(path, **_VECTOR_IO)
+
+def write_fires(gdf: gpd.GeoDataFrame, path: str, mode: str = "w"):
+    """Write (mode='w') or append (mode='a') a fire history file with pyogrio."""
+    options = {}
+    if path.lower().endswith(".fgb"):
+        # The packed R-tree of FlatGeobuf reorders the features; the history relies on row order
+        options["SPATIAL_INDEX"] = "NO"
+    gdf.to_file(path, mode=mode, **_VECTOR_IO, **options)
+
+@lru_cache(maxsize=32)
+def get_crs(code) -> CRS:
+    """
+    Return a pyproj CRS for `code` (e.g. 'EPSG:4326'), parsing it from the PROJ database only once.
+    """
+    return CRS.from_user_input(code)
+
 def create_geodataframe(polygons, areas, crs, time):
     """
     Create a GeoDataFrame from a polygons list.
@@ -314,11 +722,29 @@ def create_geodataframe(polygons, areas, crs, time):
     Returns:
     - gdf(gpd.GeoDataFrame): geodataframe with the attributes 'time' and 'area'
     """
+    if isinstance(crs, str):
+        crs = get_crs(crs)
     gdf = gpd.GeoDataFrame(geometry=polygons, crs=crs)
     gdf["time"] = time
     gdf["area"] = areas
     return gdf
 
+def init_fire_history(new_gdf:gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Build the first fire history table from the polygons of the first detection.
+
+    Arguments:
+    - new_gdf(gpd.GeoDataFrame): geodataframe from the function 'create_geodataframe(polygons, areas, crs, time)'
+
+    Returns:
+    - gdf(gpd.GeoDataFrame): history with the attributes 'fire', 'time', 'area', 'time_area' and 'acc_area'
+    """
+    new_gdf = new_gdf.copy()
+    new_gdf["fire"] = 1
+    new_gdf["time_area"] = new_gdf["area"].round(2)
+    new_gdf["acc_area"] = new_gdf["area"].round(2)
+    return new_gdf
+
 def create_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
     """
     Create a shapefile with the new polygons detected. 
@@ -331,16 +757,12 @@ def create_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
     - The shapefile at `shapefile_path` is created in-place with the new entries.
     - Console messages summarize the actions taken.
     """
-    new_gdf = new_gdf.copy()
-    new_gdf["fire"] = 1
-    new_gdf["time_area"] = new_gdf["area"].round(2)
-    new_gdf["acc_area"] = new_gdf["area"].round(2)
-    new_gdf.to_file(shapefile_path)
+    write_fires(init_fire_history(new_gdf), shapefile_path)
     print(f"📁 Shapefile create: {shapefile_path}")
 
-def update_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
+def update_fire_history(existing_gdf:gpd.GeoDataFrame, new_gdf:gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
-    Updates a wildfire shapefile with newly detected polygons, preserving temporal history.
+    Updates a wildfire history table with newly detected polygons, preserving temporal history.
 
     For each new polygon in `new_gdf`:
     - If it overlaps with an existing fire (same 'fire' ID), it is merged with the last known geometry.
@@ -350,33 +772,45 @@ def update_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
     - Previous fire records are preserved to maintain a temporal history (no deletions).
 
     Arguments:
+    - existing_gdf (gpd.GeoDataFrame): Current fire history (e.g. read from the shapefile).
     - new_gdf (gpd.GeoDataFrame): GeoDataFrame containing new polygons to add. Must include 'geometry' and 'time' columns.
-    - shapefile_path (str): Path to the existing shapefile to be updated.
 
     Notes:
-    - Geometries are simplified via unary union when overlapping.
+    - Overlapping geometries are merged with a pairwise GEOS union (last geometry ∪ new polygon).
+    - Overlap candidates come from an STRtree over the last geometry of each existing fire.
+      Fires grown within the same call are screened by their envelope before `intersects`.
+    - A new polygon already covered by the last geometry of its fire is ignored without
+      computing the union (the area of that geometry is computed at most once per fire).
     - Areas are calculated geodetically using the WGS84 ellipsoid.
-    - If the shapefile does not contain a 'fire' column, it will be created or renamed from 'id'.
-
-    Output:
-    - The shapefile at `shapefile_path` is updated in-place with the new entries.
+    - If the history does not contain a 'fire' column, it will be created or renamed from 'id'.
     - Console messages summarize the actions taken.
-    """
 
-    existing_gdf = gpd.read_file(shapefile_path)
-    updated_gdf = existing_gdf.copy()
-    geod = Geod(ellps="WGS84")
+    Returns:
+    - updated_gdf (gpd.GeoDataFrame): History with the new entries, columns ['fire', 'time', 'time_area', 'acc_area', 'geometry'].
+    """
 
     # 🔧 Corregir nombre si 'fire' no existe
     if 'fire' not in existing_gdf.columns:
         if 'id' in existing_gdf.columns:
             existing_gdf = existing_gdf.rename(columns={"id": "fire"})
         else:
-            existing_gdf["fire"] = 1
+            existing_gdf = existing_gdf.assign(fire=1)
 
     # Inicializar siguiente ID disponible
     next_fire_id = existing_gdf["fire"].max() + 1
 
+    # 📌 Último registro de cada incendio existente (en orden de aparición) e índice espacial
+    fire_ids = existing_gdf["fire"].unique()
+    last_rows = existing_gdf.sort_values("time", kind="stable").groupby("fire").tail(1)
+    last_geom = dict(zip(last_rows["fire"], last_rows.geometry))
+    last_acc = dict(zip(last_rows["fire"], last_rows["acc_area"]))
+    last_area = {}  # área geodésica (ha) de la última geometría, calculada bajo demanda
+    tree = STRtree([last_geom[fire_id] for fire_id in fire_ids])
+    # Incendios cuya geometría ha crecido en esta llamada (el árbol ya no los representa)
+    # y la envolvente de su geometría actual
+    grown = {}
+    new_rows = []
+
     for idx, new_row in new_gdf.iterrows():
         new_geom = new_row.geometry
         time_tag = new_row["time"]
@@ -387,61 +821,87 @@ def update_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
 
         found_overlap = False
 
-        # 🔍 Buscar incendios existentes que solapen
-        for fire_id in existing_gdf["fire"].unique():
-            fire_history = updated_gdf[updated_gdf["fire"] == fire_id]
-            last_record = fire_history.sort_values("time").iloc[-1]
-            fire_geom = last_record.geometry
-
-            if new_geom.intersects(fire_geom):
-                # 🔁 Fusionar geometrías
-                combined_geom = unary_union([fire_geom, new_geom])
+        # 🔍 Buscar incendios existentes que solapen: el árbol ya aplica el predicado exacto
+        # (geometría nueva preparada); los que han crecido se comprueban con su geometría actual
+        hits = set(tree.query(new_geom, predicate="intersects").tolist()) - grown.keys()
+        nx0, ny0, nx1, ny1 = new_geom.bounds
+        for n in sorted(hits | grown.keys()):
+            fire_id = fire_ids[n]
+            fire_geom = last_geom[fire_id]
+
+            if n not in hits:
+                # Envolventes disjuntas: se evita el predicado GEOS
+                fx0, fy0, fx1, fy1 = grown[n]
+                if fx1 < nx0 or fx0 > nx1 or fy1 < ny0 or fy0 > ny1:
+                    continue
+
+            if n in hits or fire_geom.intersects(new_geom):
+                # Ya contenido en el último perímetro: la unión tendría el área de ese perímetro
+                if fire_geom.covers(new_geom):
+                    if fire_id not in last_area:
+                        fire_area_m2, _ = _GEOD.geometry_area_perimeter(fire_geom)
+                        last_area[fire_id] = round(abs(fire_area_m2) / 10_000, 2)
+                    if np.isclose(last_acc[fire_id], last_area[fire_id], atol=0.01):
+                        print(f"⚠️ Ignored fire={fire_id} in {time_tag}: no changes in area.")
+                        found_overlap = True
+                        break
+
+                # 🔁 Fusionar geometrías (unión directa de dos geometrías, sin colección intermedia)
+                combined_geom = fire_geom.union(new_geom)
 
                 # Área del nuevo polígono
-                time_area_m2, _ = geod.geometry_area_perimeter(new_geom)
+                time_area_m2, _ = _GEOD.geometry_area_perimeter(new_geom)
                 time_area_ha = round(abs(time_area_m2) / 10_000, 2)
 
                 # Nueva área acumulada
-                combined_area_m2, _ = geod.geometry_area_perimeter(combined_geom)
+                combined_area_m2, _ = _GEOD.geometry_area_perimeter(combined_geom)
                 acc_area_ha = round(abs(combined_area_m2) / 10_000, 2)
 
                 # Obtener área acumulada anterior
-                prev_acc_area = last_record["acc_area"]
+                prev_acc_area = last_acc[fire_id]
                 if np.isclose(prev_acc_area, acc_area_ha, atol=0.01):
                     print(f"⚠️ Ignored fire={fire_id} in {time_tag}: no changes in area.")
                     found_overlap = True
                     break
 
-                new_entry = gpd.GeoDataFrame({
-                    "time": [time_tag],
-                    "fire": [fire_id],
-                    "geometry": [combined_geom],
-                    "time_area": [time_area_ha],
-                    "acc_area": [acc_area_ha]
-                }, crs=existing_gdf.crs)
-
-                updated_gdf = pd.concat([updated_gdf, new_entry], ignore_index=True)
+                new_rows.append({
+                    "time": time_tag,
+                    "fire": fire_id,
+                    "geometry": combined_geom,
+                    "time_area": time_area_ha,
+                    "acc_area": acc_area_ha
+                })
+                shapely.prepare(combined_geom)  # se vuelve a consultar con cada nuevo polígono
+                last_geom[fire_id] = combined_geom
+                last_acc[fire_id] = acc_area_ha
+                last_area[fire_id] = acc_area_ha
+                grown[n] = combined_geom.bounds
                 print(f"🔁 Fire={fire_id} updated | time_area={time_area_ha:.2f} ha | acc_area={acc_area_ha:.2f} ha")
                 found_overlap = True
                 break
 
         if not found_overlap:
             # ➕ Crear nuevo incendio
-            time_area_m2, _ = geod.geometry_area_perimeter(new_geom)
+            time_area_m2, _ = _GEOD.geometry_area_perimeter(new_geom)
             time_area_ha = abs(time_area_m2) / 10_000
 
-            new_entry = gpd.GeoDataFrame({
-                "time": [time_tag],
-                "fire": [next_fire_id],
-                "geometry": [new_geom],
-                "time_area": [time_area_ha],
-                "acc_area": [time_area_ha]
-            }, crs=existing_gdf.crs)
-
-            updated_gdf = pd.concat([updated_gdf, new_entry], ignore_index=True)
+            new_rows.append({
+                "time": time_tag,
+                "fire": next_fire_id,
+                "geometry": new_geom,
+                "time_area": time_area_ha,
+                "acc_area": time_area_ha
+            })
             print(f"➕ New fire added: fire={next_fire_id} | time_area={time_area_ha:.2f} ha")
             next_fire_id += 1
 
+    # ➕ Añadir todas las nuevas entradas de una vez (sin copiar antes el histórico)
+    if new_rows:
+        new_entries = gpd.GeoDataFrame(new_rows, geometry="geometry", crs=existing_gdf.crs)
+        updated_gdf = pd.concat([existing_gdf, new_entries], ignore_index=True)
+    else:
+        updated_gdf = existing_gdf.copy(deep=False)
+
     # 🧹 Reordenar columnas
     ordered_cols = ["fire", "time", "time_area", "acc_area", "geometry"]
     for col in ordered_cols:
@@ -450,6 +910,25 @@ def update_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
 
     updated_gdf = updated_gdf[ordered_cols]
 
+    return updated_gdf
+
+def update_shapefile(new_gdf:gpd.GeoDataFrame, shapefile_path:str):
+    """
+    Updates a wildfire shapefile with newly detected polygons, preserving temporal history.
+
+    See `update_fire_history` for the merge rules.
+
+    Arguments:
+    - new_gdf (gpd.GeoDataFrame): GeoDataFrame containing new polygons to add. Must include 'geometry' and 'time' columns.
+    - shapefile_path (str): Path to the existing shapefile to be updated.
+
+    Output:
+    - The shapefile at `shapefile_path` is updated in-place with the new entries.
+    - Console messages summarize the actions taken.
+    """
+    existing_gdf = read_fires(shapefile_path)
+    updated_gdf = update_fire_history(existing_gdf, new_gdf)
+
     # 💾 Guardar shapefile
-    updated_gdf.to_file(shapefile_path)
-    print(f"✅ Shapefile updated: {shapefile_path}")
\ No newline at end of file
+    write_fires(updated_gdf, shapefile_path)
+    print(f"✅ Shapefile updated: {shapefile_path}")